@@ -5,12 +5,24 @@
 #               Also supports initializing new template files from a base template.
 # Last updated: 2025-11-14
 
+from __future__ import annotations
+
 import argparse
+import functools
 import json
+import re
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
+
+# pandas / openpyxl are imported lazily in main(), only for the build-checklist
+# mode, so --init-template does not pay their (large) import cost.
+if TYPE_CHECKING:
+    import pandas as pd
 
-import pandas as pd
+try:
+    import orjson  # optional C-level JSON encoder; stdlib json is the fallback
+except ImportError:
+    orjson = None
 
 
 REQUIRED_HEADER_FIELDS = [
@@ -23,26 +35,67 @@ REQUIRED_HEADER_FIELDS = [
     "RUN_LABEL_DEFAULT",
 ]
 
+# Blank value for every expected header key, merged under the sheet values
+HEADER_DEFAULTS = dict.fromkeys(REQUIRED_HEADER_FIELDS, "")
+
 # Default base template used when creating new templates
 DEFAULT_BASE_TEMPLATE = Path("templates/SOP_Build_Checklist_template_v3_3.html")
 
+# Template placeholders ({{STEPS_JSON}}, {{APP_TITLE}}, ...), matched in a
+# single pass over the raw template bytes
+PLACEHOLDER_RE = re.compile(
+    rb"\{\{(" + "|".join(["STEPS_JSON", *REQUIRED_HEADER_FIELDS]).encode("ascii") + rb")\}\}"
+)
+
+# Provenance comment stamped at the top of templates created by init_template
+PROVENANCE_TEMPLATE = (
+    "<!--\n"
+    "  Provenance: Developed collaboratively by Subi Rajagopalan and ChatGPT (GPT-5.1 Thinking)\n"
+    "  Template: {template_name}\n"
+    "  Created from base: {base_name}\n"
+    "-->\n"
+)
+
+# str.translate table for slugify: deletes every ASCII char that is not
+# alphanumeric, "_" or "-"
+SLUG_DROP_ASCII = {
+    i: None for i in range(128) if not (chr(i).isalnum() or chr(i) in "_-")
+}
+
+
+def dumps_json(obj) -> bytes:
+    """
+    Serialize obj as compact, UTF-8 encoded JSON (no ASCII escaping); it is
+    only embedded in a <script> tag, so it is not pretty-printed.
+    Uses orjson when installed, otherwise the stdlib json module.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 
-def load_header(sheet: pd.DataFrame) -> dict:
+def load_header(ws) -> dict:
     """
     Convert Header sheet (Field/Value) into a dict.
+
+    `ws` is an openpyxl worksheet; the first row names the Field/Value columns.
     """
     header = {}
-    for _, row in sheet.iterrows():
-        field = str(row.get("Field", "")).strip()
-        value = "" if pd.isna(row.get("Value")) else str(row.get("Value"))
+    rows = ws.iter_rows(values_only=True)
+    columns = [str(c).strip() if c is not None else "" for c in next(rows, ())]
+    i_field = columns.index("Field") if "Field" in columns else None
+    i_value = columns.index("Value") if "Value" in columns else None
+
+    for row in rows:
+        raw_field = row[i_field] if i_field is not None and i_field < len(row) else None
+        raw_value = row[i_value] if i_value is not None and i_value < len(row) else None
+        field = "" if raw_field is None else str(raw_field).strip()
+        value = "" if raw_value is None else str(raw_value)
         if field:
             header[field] = value
 
     # Ensure all expected keys exist (fill blanks if missing)
-    for key in REQUIRED_HEADER_FIELDS:
-        header.setdefault(key, "")
-
-    return header
+    return {**HEADER_DEFAULTS, **header}
 
 
 def load_steps(sheet: pd.DataFrame) -> list:
@@ -57,61 +110,64 @@ def load_steps(sheet: pd.DataFrame) -> list:
     if "StepOrder" not in sheet.columns:
         sheet["StepOrder"] = range(1, len(sheet) + 1)
 
-    # Sort by StepOrder (numeric if possible)
-    try:
-        sheet["StepOrder_numeric"] = pd.to_numeric(sheet["StepOrder"])
-        sheet = sheet.sort_values("StepOrder_numeric")
-    except Exception:
-        # Fallback: sort as strings
-        sheet = sheet.sort_values("StepOrder", kind="stable")
+    fields = [
+        "StepOrder",
+        "StepID",
+        "Title",
+        "InputNeeded",
+        "Program",
+        "Command",
+        "Variants",
+        "ExpectedOutputFile",
+        "ExpectedOutputFolder",
+        "Hints",
+        "Phase",
+    ]
+    present = [name for name in fields if name in sheet.columns]
+
+    # Convert every field to a plain string in one vectorized pass
+    # (blank cells -> ""), so the row loop works on clean Python strings.
+    text = sheet[present].astype(object).where(sheet[present].notna(), "").astype(str)
 
     steps = []
 
-    def s(val) -> str:
-        return "" if pd.isna(val) else str(val)
-
-    for _, row in sheet.iterrows():
-        step_order = row.get("StepOrder", "")
-        step_id = row.get("StepID", "")
-        title = row.get("Title", "")
-        input_needed = row.get("InputNeeded", "")
-        program = row.get("Program", "")
-        command = row.get("Command", "")
-        variants = row.get("Variants", "")
-        expected_file = row.get("ExpectedOutputFile", "")
-        expected_folder = row.get("ExpectedOutputFolder", "")
-        hints = row.get("Hints", "")
-        phase = row.get("Phase", "")
+    def column(name: str) -> list:
+        # Whole column as a plain list ("" when the column is absent)
+        return text[name].tolist() if name in text.columns else [""] * len(text)
 
+    for (step_order, step_id, title, input_needed, program, command, variants,
+         expected_file, expected_folder, hints, phase) in zip(*(column(name) for name in fields)):
         # Build a combined reminder text (multi-line) from the fields
-        rem_lines = []
-        if s(input_needed):
-            rem_lines.append(f"Inputs needed: {s(input_needed)}")
-        if s(program):
-            rem_lines.append(f"Program: {s(program)}")
-        if s(variants):
-            rem_lines.append(f"Variants: {s(variants)}")
-        if s(expected_file) or s(expected_folder):
-            rem_lines.append(
-                f"Expected output: {s(expected_file)} in {s(expected_folder)}".strip()
+        expected_output = (
+            f"{expected_file} in {expected_folder}".rstrip()
+            if expected_file or expected_folder
+            else ""
+        )
+        reminder_text = "\n".join(
+            f"{label}: {value}"
+            for label, value in (
+                ("Inputs needed", input_needed),
+                ("Program", program),
+                ("Variants", variants),
+                ("Expected output", expected_output),
+                ("Hints", hints),
             )
-        if s(hints):
-            rem_lines.append(f"Hints: {s(hints)}")
-        reminder_text = "\n".join(rem_lines)
+            if value
+        )
 
         step_dict = {
-            "id": f"step{step_order}" if s(step_order) else f"step{len(steps) + 1}",
-            "order": s(step_order),
-            "step_id": s(step_id),
-            "title": s(title),
-            "inputs": s(input_needed),
-            "program": s(program),
-            "command": s(command),
-            "variants": s(variants),
-            "expected_file": s(expected_file),
-            "expected_folder": s(expected_folder),
-            "hints": s(hints),
-            "phase": s(phase),
+            "id": f"step{step_order}",  # blank orders get theirs after sorting
+            "order": step_order,
+            "step_id": step_id,
+            "title": title,
+            "inputs": input_needed,
+            "program": program,
+            "command": command,
+            "variants": variants,
+            "expected_file": expected_file,
+            "expected_folder": expected_folder,
+            "hints": hints,
+            "phase": phase,
             "reminder": reminder_text,
             # Interactive fields – start empty; UI will fill these
             "notes": "",
@@ -119,37 +175,40 @@ def load_steps(sheet: pd.DataFrame) -> list:
         }
         steps.append(step_dict)
 
-    return steps
+    # Sort by StepOrder, numerically; blank / non-numeric orders go last
+    def order_key(step: dict) -> float:
+        try:
+            return float(step["order"])
+        except ValueError:
+            return float("inf")
 
+    steps.sort(key=order_key)
 
-def embed_steps_json(html: str, steps: list) -> str:
-    """
-    Replace the {{STEPS_JSON}} placeholder with a JSON representation of `steps`.
-    Also escape any closing </script> tags inside JSON.
-    """
-    steps_json = json.dumps(steps, indent=2)
-    steps_json_safe = steps_json.replace("</script>", "<\\/script>")
-    return html.replace("{{STEPS_JSON}}", steps_json_safe)
+    # Fallback ids follow the sorted position, as when the sheet was sorted first
+    for position, step in enumerate(steps, start=1):
+        if not step["order"]:
+            step["id"] = f"step{position}"
+    return steps
 
 
-def embed_header_placeholders(html: str, header: dict) -> str:
+def render_template(template: bytes, header: dict, steps: list) -> bytes:
     """
-    Replace header placeholders in the template with values from header dict.
+    Fill the template in one pass: {{STEPS_JSON}} becomes a JSON representation
+    of `steps` (with closing </script> tags escaped) and the header placeholders
+    take their values from the header dict.
     """
     replacements = {
-        "{{APP_TITLE}}": header.get("APP_TITLE", ""),
-        "{{APP_TITLE_VISIBLE}}": header.get("APP_TITLE_VISIBLE", ""),
-        "{{META_REPO}}": header.get("META_REPO", ""),
-        "{{META_ENTITY}}": header.get("META_ENTITY", ""),
-        "{{META_SOP_DEFAULT}}": header.get("META_SOP_DEFAULT", ""),
-        "{{META_IMG_FOLDER_DEF}}": header.get("META_IMG_FOLDER_DEF", ""),
-        "{{RUN_LABEL_DEFAULT}}": header.get("RUN_LABEL_DEFAULT", ""),
+        key.encode("ascii"): header.get(key, "").encode("utf-8")
+        for key in REQUIRED_HEADER_FIELDS
     }
+    if b"{{STEPS_JSON}}" in template:
+        steps_json = dumps_json(steps)
+        # Step text almost never contains </script>; only copy when it does
+        if b"</script>" in steps_json:
+            steps_json = steps_json.replace(b"</script>", b"<\\/script>")
+        replacements[b"STEPS_JSON"] = steps_json
 
-    for placeholder, value in replacements.items():
-        html = html.replace(placeholder, value)
-
-    return html
+    return PLACEHOLDER_RE.sub(lambda m: replacements[m.group(1)], template)
 
 
 def slugify(value: str) -> str:
@@ -157,8 +216,10 @@ def slugify(value: str) -> str:
     Simple slug: keep alphanumerics, underscores, and hyphens.
     Replace spaces with underscores.
     """
-    value = value.strip().replace(" ", "_")
-    cleaned = "".join(ch for ch in value if ch.isalnum() or ch in ("_", "-"))
+    cleaned = value.strip().replace(" ", "_").translate(SLUG_DROP_ASCII)
+    if not cleaned.isascii():
+        # Rare: non-ASCII input; keep Unicode alphanumerics as before
+        cleaned = "".join(ch for ch in cleaned if ch.isalnum() or ch in ("_", "-"))
     return cleaned or "Checklist"
 
 
@@ -195,6 +256,12 @@ def build_output_path(
     return default_dir / filename
 
 
+@functools.lru_cache(maxsize=4)
+def _read_base_template(path_str: str) -> str:
+    """Read (and cache) a base template, so batch init_template calls hit disk once."""
+    return Path(path_str).read_text(encoding="utf-8")
+
+
 def init_template(new_template_path: Path, base_template_path: Optional[Path]) -> None:
     """
     Create a new template file by copying from a base template and stamping provenance.
@@ -209,14 +276,11 @@ def init_template(new_template_path: Path, base_template_path: Optional[Path]) -
 
     new_template_path.parent.mkdir(parents=True, exist_ok=True)
 
-    base_html = base_path.read_text(encoding="utf-8")
+    base_html = _read_base_template(str(base_path.resolve()))
 
-    provenance_comment = (
-        "<!--\n"
-        "  Provenance: Developed collaboratively by Subi Rajagopalan and ChatGPT (GPT-5.1 Thinking)\n"
-        f"  Template: {new_template_path.name}\n"
-        f"  Created from base: {base_path.name}\n"
-        "-->\n"
+    provenance_comment = PROVENANCE_TEMPLATE.format(
+        template_name=new_template_path.name,
+        base_name=base_path.name,
     )
 
     # Prepend the comment to the base template
@@ -302,34 +366,38 @@ def main() -> None:
     if not template_path.is_file():
         raise FileNotFoundError(f"Template HTML file not found: {template_path}")
 
-    # Load Excel sheets
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    # Load Excel sheets from one open workbook: Header straight from openpyxl,
+    # Steps via pandas (which accepts the open openpyxl workbook as-is)
     try:
-        xls = pd.read_excel(spec_path, sheet_name=None)
+        wb = load_workbook(spec_path, read_only=True, data_only=True)
     except Exception as e:
         raise RuntimeError(f"Failed to read spec Excel file: {e}") from e
 
-    if "Header" not in xls:
-        raise KeyError("Spec Excel must contain a 'Header' sheet.")
-    if "Steps" not in xls:
-        raise KeyError("Spec Excel must contain a 'Steps' sheet.")
-
-    header_sheet = xls["Header"]
-    steps_sheet = xls["Steps"]
+    try:
+        if "Header" not in wb.sheetnames:
+            raise KeyError("Spec Excel must contain a 'Header' sheet.")
+        if "Steps" not in wb.sheetnames:
+            raise KeyError("Spec Excel must contain a 'Steps' sheet.")
+        header = load_header(wb["Header"])
+        try:
+            steps_sheet = pd.read_excel(wb, sheet_name="Steps", engine="openpyxl")
+        except Exception as e:
+            raise RuntimeError(f"Failed to read spec Excel file: {e}") from e
+    finally:
+        wb.close()
 
-    header = load_header(header_sheet)
     steps = load_steps(steps_sheet)
 
-    # Read template HTML
-    html_text = template_path.read_text(encoding="utf-8")
-
-    # Embed header and steps
-    html_text = embed_header_placeholders(html_text, header)
-    html_text = embed_steps_json(html_text, steps)
+    # Read template HTML and embed header and steps
+    html = render_template(template_path.read_bytes(), header, steps)
 
     # Determine output path based on header or CLI override
     out_path = build_output_path(spec_path, header, args.out_html)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(html_text, encoding="utf-8")
+    out_path.write_bytes(html)
 
     print(f"Checklist built successfully: {out_path}")
 
@@ -0,0 +1,579 @@
+"""
+Shared engine for the v4f-family checklist builders (checklist_builder_v4f1.py,
+checklist_builder_v4f_v1a.py): Excel Steps/Header loading, template
+compilation and streamed rendering, and the command-line entry point.
+
+The versioned scripts are thin shims over this module; what used to differ
+between them is expressed as keyword flags:
+- load_steps_from_excel(..., slugify=True)            DOM-safe, unique step ids (v4f1)
+- load_steps_from_excel(..., reminder_outputs=True)   OutFile/OutFolder in the reminder (v4f1)
+- load_steps_from_excel(..., strip_command_parts=...) trim Program/Variants text (v4f_v1a)
+- apply_template(..., allow_hardcoded_block=True)     patch older hard-coded templates (v4f_v1a)
+"""
+
+import argparse
+import codecs
+import functools
+import json
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+# Note: calamine drops whitespace-only text that is not marked
+# xml:space="preserve" (Excel always marks it; openpyxl-written files don't),
+# so such a cell reads as blank rather than "  ". A blank Title then falls
+# back to the step id, and a row of only such cells counts as empty.
+try:
+    import python_calamine  # noqa: F401  (Rust xlsx parser, much faster than openpyxl)
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+try:
+    import orjson  # optional C-level JSON encoder; stdlib json is the fallback
+except ImportError:
+    orjson = None
+
+NY_TZ = ZoneInfo("America/New_York")
+
+
+def _json_indent_from_env(strict: bool = False):
+    """
+    CHK_LST_JSON_INDENT: spaces of JSON indentation (e.g. 2 for debugging); unset/empty = compact.
+    A value that is not a whole number means compact too, unless strict (then SystemExit).
+    """
+    raw = os.environ.get("CHK_LST_JSON_INDENT", "").strip()
+    if not raw:
+        return None
+    if not raw.isdigit():
+        if strict:
+            raise SystemExit(f"[ERROR] CHK_LST_JSON_INDENT must be a whole number, got: {raw!r}")
+        return None
+    return int(raw)
+
+
+# Steps JSON layout: compact by default (smallest, fastest to encode).
+# Lenient here so importing never fails; run() rejects a bad value.
+JSON_INDENT = _json_indent_from_env()
+
+# Any {{PLACEHOLDER}} in a template; all are substituted in a single pass
+PLACEHOLDER_RE = re.compile(r"\{\{([A-Z_][A-Z0-9_]*)\}\}")
+
+# Runs of characters that are not safe in an HTML id (see slugify_step_id)
+SLUG_RE = re.compile(r"[^A-Za-z0-9]+")
+
+# Fallback patch points in older hard-coded templates (compiled once)
+TITLE_RE = re.compile(r"(<title>)(.*?)(</title>)", re.I | re.S)
+HEADER_TITLE_RE = re.compile(r'(<div[^>]*\bid="headerTitle"[^>]*>)(.*?)(</div>)', re.I | re.S)
+STEPS_BLOCK_RE = re.compile(r"(let\s+steps\s*=\s*)(\[[\s\S]*?\])(\s*;)")
+
+# Steps fields -> candidate column names, in col_lookup preference order
+STEP_COLUMNS = {
+    "order":    ("StepOrder", "Order", "Seq"),
+    "step_id":  ("StepID", "Step Id", "ID"),
+    "title":    ("Title", "StepTitle"),
+    "cmd":      ("Command", "Cmd"),
+    "inputs":   ("InputNeeded", "Inputs"),
+    "hints":    ("Hints", "Hint"),
+    "program":  ("Program",),
+    "variants": ("Variants",),
+    "phase":    ("Phase",),
+    "out_file": ("ExpectedOutputFile", "OutputFile", "Expected Output File"),
+    "out_fold": ("ExpectedOutputFolder", "OutputFolder", "Expected Output Folder"),
+}
+# Only mapped with reminder_outputs=True
+REMINDER_OUTPUT_FIELDS = ("out_file", "out_fold")
+
+# Header-sheet meta defaults; a builder may override some of them
+META_DEFAULTS = {
+    "APP_TITLE": "Checklist",
+    "META_REPO": "/workspaces/EdxBuild",
+    "META_ENTITY": "",
+    "META_SOP_DEFAULT": "",
+    "META_IMG_FOLDER_DEF": "",
+    "META_WEBROOT": "",
+}
+
+
+def _orjson_option():
+    """orjson option for JSON_INDENT, or None when orjson can't produce that layout."""
+    if orjson is None:
+        return None
+    if JSON_INDENT is None:
+        return 0
+    if JSON_INDENT == 2:
+        return orjson.OPT_INDENT_2
+    return None  # orjson only knows 2-space indent
+
+
+def _json_kwargs() -> dict:
+    """stdlib json arguments for JSON_INDENT (UTF-8, no ASCII escaping)."""
+    if JSON_INDENT is None:
+        return {"ensure_ascii": False, "separators": (",", ":")}
+    return {"ensure_ascii": False, "indent": JSON_INDENT}
+
+
+def dumps_json(obj) -> str:
+    """
+    Serialize obj as JSON laid out per JSON_INDENT (compact unless
+    CHK_LST_JSON_INDENT is set). Uses orjson when installed and able to,
+    otherwise the stdlib json module (also for integers wider than 64 bits,
+    e.g. a huge StepOrder, which orjson rejects).
+    """
+    option = _orjson_option()
+    if option is not None:
+        try:
+            return orjson.dumps(obj, option=option).decode("utf-8")
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj, **_json_kwargs())
+
+
+def dump_json(obj, fh) -> None:
+    """
+    Write obj as JSON (see dumps_json) straight to a binary file handle.
+    orjson's bytes go out as-is; the stdlib fallback streams its chunks
+    through a UTF-8 writer. orjson encodes fully before writing, so falling
+    back after it rejects the payload never leaves partial output.
+    """
+    option = _orjson_option()
+    if option is not None:
+        try:
+            fh.write(orjson.dumps(obj, option=option))
+            return
+        except orjson.JSONEncodeError:
+            pass
+    json.dump(obj, codecs.getwriter("utf-8")(fh), **_json_kwargs())
+
+
+def build_col_index(df):
+    """
+    Build the lookup maps used by col_lookup once per DataFrame:
+    (stripped column name -> column, lower-cased name -> column).
+    """
+    exact = {str(c).strip(): c for c in df.columns}
+    lower = {k.lower(): v for k, v in exact.items()}
+    return exact, lower
+
+
+def col_lookup(indexes, *candidates):
+    """Return the actual column name found via build_col_index maps (case-insensitive fallback)."""
+    exact, lower = indexes
+    for name in candidates:
+        if name in exact:
+            return exact[name]
+    for name in candidates:
+        low = name.lower()
+        if low in lower:
+            return lower[low]
+    return None
+
+
+def slugify_step_id(s: str) -> str:
+    """
+    Convert an arbitrary StepID into something safe for HTML id / JS selectors.
+    Keeps it readable, stable, and predictable.
+    """
+    s = (s or "").strip()
+    if not s:
+        return ""
+    # Replace any run of non-alphanum with underscore
+    s = SLUG_RE.sub("_", s)
+    s = s.strip("_")
+    # HTML id cannot start with a digit in some selector contexts; prefix if needed
+    if s and s[0].isdigit():
+        s = f"step_{s}"
+    return s.lower()
+
+
+def ensure_unique_id(candidate: str, used: set, counters: dict) -> str:
+    """
+    Ensure step ids are unique (append _2, _3, ... if needed).
+    `counters` remembers the next suffix to try per base id (a
+    defaultdict(lambda: 2)), so many repeats of one id stay linear.
+    """
+    if candidate not in used:
+        used.add(candidate)
+        return candidate
+    i = counters[candidate]
+    while f"{candidate}_{i}" in used:
+        i += 1
+    counters[candidate] = i + 1
+    final = f"{candidate}_{i}"
+    used.add(final)
+    return final
+
+
+def _join_nonblank(parts: list, sep: str) -> pd.Series:
+    """Row-wise sep.join of the non-empty entries across same-indexed str Series."""
+    out = parts[0]
+    for part in parts[1:]:
+        out = (out + sep + part).where((out != "") & (part != ""), out + part)
+    return out
+
+
+def resolve_orders(values: pd.Series, position: pd.Series) -> pd.Series:
+    """
+    StepOrder cells as ints, vectorized: numbers truncate to int, blanks and
+    text fall back to the row position. int64 can't hold inf or huge values
+    (the cast would raise or wrap), so those few cells go through a per-cell
+    int() with the same fallback, as the old row loop did.
+    """
+    num = pd.to_numeric(values, errors="coerce")
+    in_range = num.abs() < 2**63
+    orders = num.where(in_range).fillna(position).astype("int64")
+
+    wide = num.notna() & ~in_range
+    if wide.any():
+        orders = orders.astype(object)
+        for i in wide[wide].index:
+            try:
+                orders.at[i] = int(num.at[i])  # cells arrive as str; use the parsed number
+            except Exception:
+                orders.at[i] = int(position.at[i])
+    return orders
+
+
+def load_steps_from_excel(
+    xls: pd.ExcelFile,
+    *,
+    slugify: bool = False,
+    reminder_outputs: bool = False,
+    strip_command_parts: bool = True,
+):
+    """
+    Load steps from the Excel 'Steps' sheet (or first sheet if not present).
+
+    Flexible columns supported (common):
+      StepOrder/Order/Seq, StepID/ID, Title, Command, InputNeeded, Hints,
+      Program, Variants, Phase, ExpectedOutputFile, ExpectedOutputFolder
+
+    slugify             -- ids become DOM-safe slugs, de-duplicated with _2, _3, ...
+    reminder_outputs    -- include ExpectedOutputFile/Folder in the reminder line
+    strip_command_parts -- trim Program/Variants text before labelling it
+    """
+    sheet_name = "Steps" if "Steps" in xls.sheet_names else xls.sheet_names[0]
+
+    # One parse of the sheet, as strings, of just the columns some field could
+    # map to (col_lookup matches stripped names, then case-insensitively)
+    fields = [
+        name for name in STEP_COLUMNS
+        if reminder_outputs or name not in REMINDER_OUTPUT_FIELDS
+    ]
+    wanted = {cand.lower() for name in fields for cand in STEP_COLUMNS[name]}
+    df = xls.parse(sheet_name, usecols=lambda c: str(c).strip().lower() in wanted, dtype="string")
+    idx = build_col_index(df)
+
+    # The mapped columns go into a slim frame under fixed names
+    resolved = {
+        name: col_lookup(idx, *STEP_COLUMNS[name]) if name in fields else None
+        for name in STEP_COLUMNS
+    }
+
+    # Rows blank in every mapped column are dropped once up front (index
+    # kept: it drives the fallback order). Unmapped columns are never read,
+    # so a row filled only in one of those is skipped too, unlike
+    # checklist_builder.py, which keeps it as a step of defaults.
+    slim = pd.DataFrame(
+        {name: df[col] for name, col in resolved.items() if col}, index=df.index
+    ).reindex(columns=list(resolved))
+    slim = slim.dropna(how="all")
+
+    # Normalise once per column, not per cell: text columns become plain str
+    # ("" for blanks) and ORDER is numeric or falls back to the row position.
+    text_cols = [name for name in resolved if name != "order"]
+    text = slim[text_cols].astype(object).where(slim[text_cols].notna(), "").astype(str)
+    position = pd.Series(slim.index + 1, index=slim.index)
+    orders = resolve_orders(slim["order"], position)
+
+    # Each field is built column-wise, then the steps list is assembled in a
+    # single pass already in ORDER (stable argsort: ties keep sheet order).
+    order_list = orders.tolist()
+
+    # RAW ID (human) -> step id; with slugify, uniqueness suffixes follow sheet order
+    raw_ids = text["step_id"].str.strip()
+    if slugify:
+        used_ids = set()
+        id_counters = defaultdict(lambda: 2)
+        ids = [
+            ensure_unique_id(slugify_step_id(raw_id) or f"step_{order_val}", used_ids, id_counters)
+            for raw_id, order_val in zip(raw_ids.tolist(), order_list)
+        ]
+    else:
+        ids = raw_ids.where(raw_ids != "", "step_" + orders.astype(str)).tolist()
+
+    # TITLE (human visible)
+    fallback_titles = raw_ids.where(raw_ids != "", pd.Series(ids, index=text.index))
+    titles = text["title"].str.strip().where(text["title"] != "", fallback_titles)
+
+    # COMMAND (multi-part)
+    program, variants = text["program"], text["variants"]
+    if strip_command_parts:
+        program, variants = program.str.strip(), variants.str.strip()
+    commands = _join_nonblank(
+        [
+            text["cmd"].str.rstrip(),
+            ("[Program] " + program).where(text["program"] != "", ""),
+            ("[Variants] " + variants).where(text["variants"] != "", ""),
+        ],
+        "\n\n",
+    ).str.strip()
+
+    # REMINDER (short line under title); unmapped fields are all "" and drop out
+    reminder_fields = (
+        ("Inputs: ", "inputs"),
+        ("OutFile: ", "out_file"),
+        ("OutFolder: ", "out_fold"),
+        ("Hints: ", "hints"),
+        ("Phase: ", "phase"),
+    )
+    reminders = _join_nonblank(
+        [(label + text[name]).where(text[name] != "", "") for label, name in reminder_fields],
+        " | ",
+    )
+
+    titles, commands, reminders = titles.tolist(), commands.tolist(), reminders.tolist()
+    steps = [
+        {
+            "id": ids[i],
+            "order": order_list[i],
+            "title": titles[i],         # human-visible
+            "command": commands[i],
+            "reminder": reminders[i],
+            "notes": "",
+            "runs": []
+        }
+        for i in orders.argsort(kind="stable")
+    ]
+    return steps
+
+
+def load_header_meta_from_excel(xls: pd.ExcelFile):
+    """
+    Optionally load meta placeholders from a 'Header' sheet: key/value pairs in first two columns.
+    Parsed from the already-open workbook; the two columns are walked as plain
+    tuples rather than row Series via iterrows().
+    """
+    meta = {}
+    if "Header" not in xls.sheet_names:
+        return meta
+
+    df = xls.parse("Header")
+    if df.shape[1] < 2:
+        return meta
+
+    for key, val in df.iloc[:, :2].itertuples(index=False, name=None):
+        key = "" if pd.isna(key) else str(key).strip()
+        if not key or key.lower() == "nan":
+            continue
+        meta[key] = "" if pd.isna(val) else str(val).strip()
+
+    return meta
+
+
+def build_default_meta(spec_path: Path, excel_meta: dict, defaults: dict = None):
+    """Merge Header-sheet meta with sane defaults (META_DEFAULTS, then `defaults`)."""
+    base = {**META_DEFAULTS, **(defaults or {})}
+
+    app_title = excel_meta.get("APP_TITLE", base["APP_TITLE"])
+
+    return {
+        "APP_TITLE": app_title,
+        "APP_TITLE_VISIBLE": excel_meta.get("APP_TITLE_VISIBLE", app_title),
+        "META_REPO": excel_meta.get("META_REPO", base["META_REPO"]),
+        "META_ENTITY": excel_meta.get("META_ENTITY", base["META_ENTITY"]),
+        "META_SOP_DEFAULT": excel_meta.get("META_SOP_DEFAULT", base["META_SOP_DEFAULT"]),
+        "META_IMG_FOLDER_DEF": excel_meta.get("META_IMG_FOLDER_DEF", base["META_IMG_FOLDER_DEF"]),
+        "META_WEBROOT": excel_meta.get("META_WEBROOT", base["META_WEBROOT"]),
+        "RUN_LABEL_DEFAULT": excel_meta.get("RUN_LABEL_DEFAULT", spec_path.stem),
+    }
+
+
+@functools.lru_cache(maxsize=8)
+def _read_template(path_str: str, mtime_ns: int) -> str:
+    """Template text, cached per (path, mtime) so batch runs read it once but see edits."""
+    return Path(path_str).read_text(encoding="utf-8")
+
+
+@functools.lru_cache(maxsize=8)
+def compile_template(text: str) -> tuple:
+    """
+    Split template text once into alternating parts: even indexes are literal
+    HTML, odd indexes are placeholder names. Rendering is then a single walk
+    over the parts instead of a search of the whole HTML per placeholder.
+    Cached, so the same template text is only split once per process
+    (call compile_template.__wrapped__ for one-off text).
+    """
+    return tuple(PLACEHOLDER_RE.split(text))
+
+
+def write_template(parts: tuple, mapping: dict, fh) -> None:
+    """
+    Stream compiled template parts to a binary file handle, chunk by chunk,
+    so the fully substituted HTML never exists as one Python str.
+    A mapping value may also be a callable that writes its own bytes to fh
+    (used for the steps JSON). Unknown placeholders are kept verbatim.
+    """
+    for i, part in enumerate(parts):
+        if i % 2:
+            value = mapping.get(part, "{{" + part + "}}")
+            if callable(value):
+                value(fh)
+                continue
+            part = value
+        fh.write(part.encode("utf-8"))
+
+
+def _replace_or_patch_title(html: str, title_text: str) -> str:
+    # Placeholder present: filled by the single placeholder pass in apply_template
+    if "{{APP_TITLE}}" in html:
+        return html
+
+    # Otherwise patch the <title>...</title>
+    return TITLE_RE.sub(lambda m: m.group(1) + title_text + m.group(3), html, count=1)
+
+
+def _replace_or_patch_header_title(html: str, visible_text: str) -> str:
+    # Placeholder present: filled by the single placeholder pass in apply_template
+    if "{{APP_TITLE_VISIBLE}}" in html:
+        return html
+
+    # Otherwise patch the default headerTitle content (id="headerTitle")
+    return HEADER_TITLE_RE.sub(lambda m: m.group(1) + visible_text + m.group(3), html, count=1)
+
+
+def _inject_steps(html: str, steps_json: str) -> str:
+    # Preferred placeholder path: filled by the single placeholder pass in apply_template
+    if "{{STEPS_JSON}}" in html:
+        return html
+
+    # Back-compat: replace `let steps = [ ... ];`
+    # This will replace anything between `let steps =` and the next `];`
+    html, n = STEPS_BLOCK_RE.subn(lambda m: m.group(1) + steps_json + m.group(3), html, count=1)
+    if n:
+        return html
+
+    # If we can’t find either, fail loudly (so we don’t ship wrong checklist silently)
+    raise SystemExit("[ERROR] Template has no {{STEPS_JSON}} and no `let steps = [...]` block to replace.")
+
+
+def apply_template(
+    template_path: Path,
+    out_path: Path,
+    steps,
+    meta_placeholders: dict,
+    *,
+    allow_hardcoded_block: bool = False,
+):
+    """
+    Read template HTML, substitute placeholders, and write output HTML.
+
+    With allow_hardcoded_block, older templates without placeholders are patched
+    first: the `let steps = [...]` block, <title> and #headerTitle.
+    """
+    template = _read_template(str(template_path), template_path.stat().st_mtime_ns)
+    html = template
+
+    if allow_hardcoded_block:
+        app_title = meta_placeholders.get("APP_TITLE", "Checklist")
+        app_title_visible = meta_placeholders.get("APP_TITLE_VISIBLE", app_title)
+
+        if "{{STEPS_JSON}}" not in html:
+            html = _inject_steps(html, dumps_json(steps))
+        html = _replace_or_patch_title(html, app_title)
+        html = _replace_or_patch_header_title(html, app_title_visible)
+
+    # One scan of the HTML for every placeholder; unknown ones are left as-is.
+    # The steps JSON is serialized straight into the output at its placeholder.
+    mapping = {
+        **{k: str(v) for k, v in meta_placeholders.items()},
+        "STEPS_JSON": functools.partial(dump_json, steps),
+    }
+    # Only the template as read goes through the cache; patched HTML already
+    # carries this spec's steps/titles, so caching it would never hit.
+    if html == template:
+        parts = compile_template(html)
+    else:
+        parts = compile_template.__wrapped__(html)
+
+    # Stream into a temp file beside the target, then swap it in: a failure
+    # part-way never leaves a truncated page in place of the previous output
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_path.open("wb") as fh:
+            write_template(parts, mapping, fh)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def derive_default_out_path(spec_path: Path, out_tag: str) -> Path:
+    """Default output: <spec_stem>_checklist_<out_tag>_YYMMDD_HHMM.html in same folder as spec."""
+    stem = spec_path.stem
+    ts = datetime.now(tz=NY_TZ).strftime("%y%m%d_%H%M")
+    return spec_path.parent / f"{stem}_checklist_{out_tag}_{ts}.html"
+
+
+def run(
+    version_tag: str,
+    *,
+    out_tag: str,
+    meta_defaults: dict = None,
+    slugify: bool = False,
+    reminder_outputs: bool = False,
+    strip_command_parts: bool = True,
+    allow_hardcoded_block: bool = False,
+    argv=None,
+):
+    """Command-line entry point shared by the versioned checklist_builder_<version_tag> scripts."""
+    log_tag = f"[checklist_builder_{version_tag}]"
+
+    parser = argparse.ArgumentParser(
+        description="Build a task-specific checklist HTML from Excel + HTML template."
+    )
+    parser.add_argument("--spec", required=True, help="Path to Excel spec file.")
+    parser.add_argument("--template", required=True, help="Path to HTML template.")
+    parser.add_argument("--out-html", help="Output HTML path (optional).")
+
+    args = parser.parse_args(argv)
+    _json_indent_from_env(strict=True)
+
+    spec_path = Path(args.spec).expanduser().resolve()
+    template_path = Path(args.template).expanduser().resolve()
+    if args.out_html:
+        out_path = Path(args.out_html).expanduser().resolve()
+    else:
+        out_path = derive_default_out_path(spec_path, out_tag)
+
+    if not spec_path.exists():
+        raise SystemExit(f"[ERROR] Spec not found: {spec_path}")
+    if not template_path.exists():
+        raise SystemExit(f"[ERROR] Template not found: {template_path}")
+
+    print(f"{log_tag} Spec     : {spec_path}")
+    print(f"{log_tag} Template : {template_path}")
+    print(f"{log_tag} Output   : {out_path}")
+
+    # Open the workbook once, shared by both loaders
+    xls = pd.ExcelFile(spec_path, engine=EXCEL_ENGINE)
+    steps = load_steps_from_excel(
+        xls,
+        slugify=slugify,
+        reminder_outputs=reminder_outputs,
+        strip_command_parts=strip_command_parts,
+    )
+    excel_meta = load_header_meta_from_excel(xls)
+    meta_placeholders = build_default_meta(spec_path, excel_meta, meta_defaults)
+
+    apply_template(
+        template_path, out_path, steps, meta_placeholders,
+        allow_hardcoded_block=allow_hardcoded_block,
+    )
+    print(f"{log_tag} Wrote checklist to: {out_path}")
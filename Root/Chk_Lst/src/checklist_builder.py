@@ -25,36 +25,101 @@ same folder as the spec.
 """
 
 import argparse
+import functools
 import json
+import re
 from pathlib import Path
 from datetime import datetime
-from zoneinfo import ZoneInfo
 
 import pandas as pd
 
+# Note: calamine drops whitespace-only text that is not marked
+# xml:space="preserve" (Excel always marks it; openpyxl-written files don't),
+# so such a cell reads as blank rather than "  ". A blank Title then falls
+# back to the step id, and a row of only such cells counts as empty.
+try:
+    import python_calamine  # noqa: F401  (Rust xlsx parser, much faster than openpyxl)
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
 
-NY_TZ = ZoneInfo("America/New_York")
+try:
+    import orjson  # optional C-level JSON encoder; stdlib json is the fallback
+except ImportError:
+    orjson = None
 
 
-def col_lookup(df, *candidates):
+# Any {{PLACEHOLDER}} in the template; substituted in a single pass over
+# the raw template bytes (placeholder names are pure ASCII)
+PLACEHOLDER_RE = re.compile(rb"\{\{([A-Z_]+)\}\}")
+
+
+def dumps_json(obj) -> bytes:
+    """
+    Serialize obj as compact, UTF-8 encoded JSON (no ASCII escaping).
+    The JSON only feeds a <script> tag, so it is not pretty-printed.
+    Uses orjson when installed (already bytes), otherwise the stdlib json module.
+    orjson rejects integers wider than 64 bits (e.g. a huge StepOrder); those
+    payloads go through json instead.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def build_col_index(df):
+    """
+    Build the lookup maps used by col_lookup once per DataFrame:
+    (stripped column name -> column, lower-cased name -> column).
+    """
+    exact = {str(c).strip(): c for c in df.columns}
+    lower = {k.lower(): v for k, v in exact.items()}
+    return exact, lower
+
+
+def col_lookup(indexes, *candidates):
     """
-    Given a DataFrame and a list of candidate column names, return the actual
-    column name found in df.columns (case-sensitive) or None.
+    Given the maps from build_col_index and a list of candidate column names,
+    return the actual column name found in df.columns (case-sensitive) or None.
     """
-    cols = {str(c).strip(): c for c in df.columns}
+    exact, lower = indexes
     for name in candidates:
-        if name in cols:
-            return cols[name]
+        if name in exact:
+            return exact[name]
     # also try case-insensitive
-    lower_map = {str(c).strip().lower(): c for c in df.columns}
     for name in candidates:
         low = name.lower()
-        if low in lower_map:
-            return lower_map[low]
+        if low in lower:
+            return lower[low]
     return None
 
 
-def load_steps_from_excel(spec_path: Path):
+def resolve_orders(values: pd.Series, position: pd.Series) -> pd.Series:
+    """
+    StepOrder cells as ints, vectorized: numbers truncate to int, blanks and
+    text fall back to the row position. int64 can't hold inf or huge values
+    (the cast would raise or wrap), so those few cells go through the old
+    per-cell int() with the same fallback.
+    """
+    num = pd.to_numeric(values, errors="coerce")
+    in_range = num.abs() < 2**63
+    orders = num.where(in_range).fillna(position).astype("int64")
+
+    wide = num.notna() & ~in_range
+    if wide.any():
+        orders = orders.astype(object)
+        for i in wide[wide].index:
+            try:
+                orders.at[i] = int(values.at[i])
+            except Exception:
+                orders.at[i] = int(position.at[i])
+    return orders
+
+
+def load_steps_from_excel(xls: pd.ExcelFile):
     """
     Load steps from the Excel 'Steps' sheet (or first sheet if not present).
 
@@ -72,69 +137,80 @@ def load_steps_from_excel(spec_path: Path):
     Returns:
         A list of dicts, each of which will be injected into {{STEPS_JSON}}.
     """
-    xls = pd.ExcelFile(spec_path)
     sheet_name = "Steps" if "Steps" in xls.sheet_names else xls.sheet_names[0]
     df = pd.read_excel(xls, sheet_name=sheet_name)
 
-    # Column mappings
-    col_order    = col_lookup(df, "StepOrder", "Order", "Seq")
-    col_step_id  = col_lookup(df, "StepID", "Step Id", "ID")
-    col_title    = col_lookup(df, "Title", "StepTitle")
-    col_cmd      = col_lookup(df, "Command", "Cmd")
-    col_input    = col_lookup(df, "InputNeeded", "Inputs")
-    col_hints    = col_lookup(df, "Hints", "Hint")
-    col_program  = col_lookup(df, "Program")
-    col_variants = col_lookup(df, "Variants")
-    col_phase    = col_lookup(df, "Phase")
+    # Drop completely empty rows up front. The original index is kept so
+    # the fallback order below is still the row's position in the sheet.
+    df = df.dropna(how="all")
 
-    steps = []
-    for idx, row in df.iterrows():
-        # Skip rows that are almost completely empty
-        if all(pd.isna(v) for v in row.values):
-            continue
+    # Column mappings
+    indexes = build_col_index(df)
+    col_order    = col_lookup(indexes, "StepOrder", "Order", "Seq")
+    col_step_id  = col_lookup(indexes, "StepID", "Step Id", "ID")
+    col_title    = col_lookup(indexes, "Title", "StepTitle")
+    col_cmd      = col_lookup(indexes, "Command", "Cmd")
+    col_input    = col_lookup(indexes, "InputNeeded", "Inputs")
+    col_hints    = col_lookup(indexes, "Hints", "Hint")
+    col_program  = col_lookup(indexes, "Program")
+    col_variants = col_lookup(indexes, "Variants")
+    col_phase    = col_lookup(indexes, "Phase")
+
+    # Normalise the text columns in one vectorized pass: blanks become ""
+    # and everything else a plain str, so the row loop needs no pd.isna().
+    str_cols = list(dict.fromkeys(
+        c for c in (col_step_id, col_title, col_cmd, col_program, col_variants,
+                    col_input, col_hints, col_phase) if c
+    ))
+    text = df[str_cols].astype(object).where(df[str_cols].notna(), "").astype(str)
+
+    # ORDER: numeric where possible, otherwise the 1-based row position
+    position = pd.Series(df.index + 1, index=df.index)
+    if col_order:
+        orders = resolve_orders(df[col_order], position)
+    else:
+        orders = position
 
-        # ORDER
-        if col_order and not pd.isna(row.get(col_order)):
-            try:
-                order_val = int(row[col_order])
-            except Exception:
-                order_val = idx + 1
-        else:
-            order_val = idx + 1
+    # Pull each mapped column out once as a plain Python list; iterating
+    # zipped lists avoids building a pd.Series per row (df.iterrows()).
+    def column(col):
+        return text[col].tolist() if col else [""] * len(df)
 
+    steps = []
+    for (order_val, step_id, title, cmd, program, variants,
+         input_needed, hints, phase) in zip(
+            orders.tolist(),
+            column(col_step_id),
+            column(col_title),
+            column(col_cmd),
+            column(col_program),
+            column(col_variants),
+            column(col_input),
+            column(col_hints),
+            column(col_phase),
+    ):
         # ID
-        raw_id = None
-        if col_step_id and not pd.isna(row.get(col_step_id)):
-            raw_id = str(row[col_step_id]).strip()
-        if not raw_id:
-            raw_id = f"step_{order_val}"
+        raw_id = step_id.strip() or f"step_{order_val}"
 
         # TITLE
-        title_val = ""
-        if col_title and not pd.isna(row.get(col_title)):
-            title_val = str(row[col_title]).strip()
-        else:
-            title_val = raw_id
+        title_val = title.strip() if title else raw_id
 
         # COMMAND
         cmd_parts = []
-        if col_cmd and not pd.isna(row.get(col_cmd)):
-            cmd_parts.append(str(row[col_cmd]).rstrip())
-        if col_program and not pd.isna(row.get(col_program)):
-            cmd_parts.append(f"[Program] {row[col_program]}")
-        if col_variants and not pd.isna(row.get(col_variants)):
-            cmd_parts.append(f"[Variants] {row[col_variants]}")
+        if cmd:
+            cmd_parts.append(cmd.rstrip())
+        if program:
+            cmd_parts.append(f"[Program] {program}")
+        if variants:
+            cmd_parts.append(f"[Variants] {variants}")
         command_val = "\n\n".join(cmd_parts).strip()
 
         # REMINDER (short text visible under the title)
-        reminder_parts = []
-        if col_input and not pd.isna(row.get(col_input)):
-            reminder_parts.append(f"Inputs: {row[col_input]}")
-        if col_hints and not pd.isna(row.get(col_hints)):
-            reminder_parts.append(f"Hints: {row[col_hints]}")
-        if col_phase and not pd.isna(row.get(col_phase)):
-            reminder_parts.append(f"Phase: {row[col_phase]}")
-        reminder_val = " | ".join(str(p) for p in reminder_parts if str(p).strip())
+        reminder_val = " | ".join(
+            f"{label}: {value}"
+            for label, value in (("Inputs", input_needed), ("Hints", hints), ("Phase", phase))
+            if value
+        )
 
         step_obj = {
             "id": raw_id,
@@ -152,7 +228,7 @@ def load_steps_from_excel(spec_path: Path):
     return steps
 
 
-def load_header_meta_from_excel(spec_path: Path):
+def load_header_meta_from_excel(xls: pd.ExcelFile):
     """
     Optionally load header/meta from a 'Header' sheet.
 
@@ -160,28 +236,25 @@ def load_header_meta_from_excel(spec_path: Path):
         First column: key (e.g., APP_TITLE, APP_TITLE_VISIBLE, META_ENTITY, etc.)
         Second column: value.
 
+    Parsed from the already-open workbook; the first two columns are walked
+    as plain tuples rather than row Series via iterrows().
+
     Returns:
         dict of key -> value (strings), used to fill template placeholders.
     """
     meta = {}
-    try:
-        xls = pd.ExcelFile(spec_path)
-    except Exception:
-        return meta
-
     if "Header" not in xls.sheet_names:
         return meta
 
-    df = pd.read_excel(xls, sheet_name="Header")
+    df = xls.parse("Header")
     if df.shape[1] < 2:
         return meta
 
-    for _, row in df.iterrows():
-        key = str(row.iloc[0]).strip() if not pd.isna(row.iloc[0]) else ""
+    for key, val in df.iloc[:, :2].itertuples(index=False, name=None):
+        key = "" if pd.isna(key) else str(key).strip()
         if not key:
             continue
-        val = "" if pd.isna(row.iloc[1]) else str(row.iloc[1]).strip()
-        meta[key] = val
+        meta[key] = "" if pd.isna(val) else str(val).strip()
 
     return meta
 
@@ -212,22 +285,37 @@ def build_default_meta(spec_path: Path, excel_meta: dict):
     }
 
 
-def apply_template(template_path: Path, out_path: Path, steps, meta_placeholders: dict):
+@functools.lru_cache(maxsize=8)
+def _load_template(path_str: str, mtime_ns: int) -> bytes:
     """
-    Read the HTML template, substitute placeholders, and write the final HTML.
+    Read template bytes, cached per (path, mtime) so repeated builds from the
+    same template skip the disk read but still pick up edits to the file.
     """
-    text = template_path.read_text(encoding="utf-8")
+    return Path(path_str).read_bytes()
 
-    # 1) Steps JSON
-    steps_json = json.dumps(steps, indent=2, ensure_ascii=False)
-    text = text.replace("{{STEPS_JSON}}", steps_json)
 
-    # 2) Meta placeholders
-    for key, value in meta_placeholders.items():
-        placeholder = "{{" + key + "}}"
-        text = text.replace(placeholder, value)
+def apply_template(template_path: Path, out_path: Path, steps, meta_placeholders: dict):
+    """
+    Read the HTML template, substitute placeholders, and write the final HTML.
+    """
+    template = _load_template(str(template_path), template_path.stat().st_mtime_ns)
+
+    # Steps JSON + meta placeholders, substituted in one scan of the HTML.
+    # Everything stays UTF-8 bytes so the output is never re-encoded.
+    # Unknown placeholders are left untouched.
+    if b"{{" in template:
+        replacements = {
+            key.encode("ascii"): value.encode("utf-8")
+            for key, value in meta_placeholders.items()
+        }
+        # Only serialize the steps if the template actually asks for them
+        if b"{{STEPS_JSON}}" in template:
+            replacements[b"STEPS_JSON"] = dumps_json(steps)
+        html = PLACEHOLDER_RE.sub(lambda m: replacements.get(m.group(1), m.group(0)), template)
+    else:
+        html = template
 
-    out_path.write_text(text, encoding="utf-8")
+    out_path.write_bytes(html)
     print(f"[checklist_builder] Wrote checklist to: {out_path}")
 
 
@@ -236,9 +324,14 @@ def derive_default_out_path(spec_path: Path, template_path: Path) -> Path:
     If --out-html is not provided, derive a reasonable default:
       <spec_stem>_checklist_v4e_YYMMDD_HHMM.html
     in the same directory as the spec.
+
+    The timestamp is New York local time (Codespaces run in UTC); zoneinfo
+    is imported here so runs that pass --out-html never load it.
     """
+    from zoneinfo import ZoneInfo
+
     stem = spec_path.stem
-    ts = datetime.now(tz=NY_TZ).strftime("%y%m%d_%H%M")  # YYMMDD_HHMM
+    ts = datetime.now(tz=ZoneInfo("America/New_York")).strftime("%y%m%d_%H%M")  # YYMMDD_HHMM
     base_name = f"{stem}_checklist_v4e_{ts}.html"
     return spec_path.parent / base_name
 
@@ -281,9 +374,10 @@ def main():
     print(f"[checklist_builder] Template : {template_path}")
     print(f"[checklist_builder] Output   : {out_path}")
 
-    # Load steps and meta
-    steps = load_steps_from_excel(spec_path)
-    excel_meta = load_header_meta_from_excel(spec_path)
+    # Load steps and meta (open the workbook once, shared by both loaders)
+    xls = pd.ExcelFile(spec_path, engine=EXCEL_ENGINE)
+    steps = load_steps_from_excel(xls)
+    excel_meta = load_header_meta_from_excel(xls)
     meta_placeholders = build_default_meta(spec_path, excel_meta)
 
     apply_template(template_path, out_path, steps, meta_placeholders)
@@ -74,7 +74,8 @@ def load_steps_from_excel(spec_path: Path):
     """
     xls = pd.ExcelFile(spec_path)
     sheet_name = "Steps" if "Steps" in xls.sheet_names else xls.sheet_names[0]
-    df = pd.read_excel(xls, sheet_name=sheet_name)
+    # Blank rows dropped once, vectorized (index kept: it drives the fallback order)
+    df = pd.read_excel(xls, sheet_name=sheet_name).dropna(how="all")
 
     # Column mappings
     col_order    = col_lookup(df, "StepOrder", "Order", "Seq")
@@ -89,10 +90,6 @@ def load_steps_from_excel(spec_path: Path):
 
     steps = []
     for idx, row in df.iterrows():
-        # Skip rows that are almost completely empty
-        if all(pd.isna(v) for v in row.values):
-            continue
-
         # ORDER
         if col_order and not pd.isna(row.get(col_order)):
             try:
@@ -21,15 +21,24 @@ This version avoids JS syntax issues by injecting JSON (newlines become \\n).
 
 from __future__ import annotations
 
-import argparse
+import functools
 import json
+import os
 import re
 import sys
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from openpyxl import load_workbook
 
+try:
+    import orjson  # optional C-level JSON encoder; stdlib json is the fallback
+except ImportError:
+    orjson = None
+
 
 # -----------------------------
 # Utilities
@@ -38,8 +47,13 @@ from openpyxl import load_workbook
 def norm(v: Any) -> str:
     return "" if v is None else str(v).strip()
 
+@functools.lru_cache(maxsize=1024)
+def low_str(s: str) -> str:
+    # Header/column names repeat across every scan; cache their folded form
+    return s.strip().lower()
+
 def low(v: Any) -> str:
-    return norm(v).lower()
+    return "" if v is None else low_str(str(v))
 
 def boolish(v: Any, default: bool = False) -> bool:
     s = low(v)
@@ -49,9 +63,17 @@ def boolish(v: Any, default: bool = False) -> bool:
         return False
     return default
 
-def json_for_js(obj: Any) -> str:
-    # Safe JS injection: embed as JSON literal directly in script
-    return json.dumps(obj, ensure_ascii=False, indent=2)
+def dump_for_js(obj: Any, fh) -> None:
+    # Safe JS injection: a JSON literal (2-space indent, raw UTF-8) streamed
+    # to a text file handle; orjson when installed, same layout, C encoder.
+    # orjson rejects ints wider than 64 bits (a huge Order cell); json takes those.
+    if orjson is not None:
+        try:
+            fh.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8"))
+            return
+        except orjson.JSONEncodeError:
+            pass
+    json.dump(obj, fh, ensure_ascii=False, indent=2)
 
 def find_sheet_name(wb, candidates: List[str]) -> Optional[str]:
     existing = {name.lower(): name for name in wb.sheetnames}
@@ -76,23 +98,23 @@ HEADER_KEY_SYNONYMS = {
     "templateTag": {"templatetag", "template tag", "tag"},
 }
 
+# synonym -> canonical key, so a lookup is one dict hit instead of a scan
+_HEADER_SYN_INDEX = {syn: canon for canon, syns in HEADER_KEY_SYNONYMS.items() for syn in syns}
+
 def canonical_header_key(k: str) -> Optional[str]:
-    lk = low(k)
-    for canon, syns in HEADER_KEY_SYNONYMS.items():
-        if lk in syns:
-            return canon
-    return None
+    return _HEADER_SYN_INDEX.get(low(k))
 
-def read_header_key_value(ws) -> Dict[str, str]:
+def _header_key_value(rows: Iterable[Tuple[Any, ...]]) -> Dict[str, str]:
     """
-    Reads Header sheet as key/value pairs.
+    Reads Header rows as key/value pairs.
     Looks for columns named Key/Value in row 1; otherwise uses A/B.
     """
-    rows = list(ws.iter_rows(values_only=True))
-    if not rows:
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
         return {}
 
-    r1 = [norm(x) for x in rows[0]]
+    r1 = [norm(x) for x in first]
     idx_key = 0
     idx_val = 1
 
@@ -106,7 +128,7 @@ def read_header_key_value(ws) -> Dict[str, str]:
     out: Dict[str, str] = {}
     blank_streak = 0
 
-    for r in rows[1:]:
+    for r in rows:
         key = norm(r[idx_key]) if idx_key < len(r) else ""
         val = norm(r[idx_val]) if idx_val < len(r) else ""
 
@@ -121,12 +143,11 @@ def read_header_key_value(ws) -> Dict[str, str]:
 
     return out
 
-def read_header_row_values(ws) -> Dict[str, str]:
+def _header_row_values(rows: List[Tuple[Any, ...]]) -> Dict[str, str]:
     """
-    Reads Header sheet where field names are in one row and values in the next row.
+    Reads Header rows where field names are in one row and values in the next row.
     We scan first ~15 rows to find a row with multiple known header fields.
     """
-    rows = list(ws.iter_rows(values_only=True))
     if len(rows) < 2:
         return {}
 
@@ -135,7 +156,10 @@ def read_header_row_values(ws) -> Dict[str, str]:
 
     # scan top rows to find the "field names" row
     for i in range(min(15, len(rows) - 1)):
-        fields = [norm(x) for x in rows[i]]
+        row = rows[i]
+        if len(row) - row.count(None) <= best_hits:
+            continue  # too few filled cells to beat the best row so far
+        fields = ["" if x is None else str(x).strip() for x in row]
         hits = 0
         for f in fields:
             if canonical_header_key(f):
@@ -147,50 +171,54 @@ def read_header_row_values(ws) -> Dict[str, str]:
     if best_i is None or best_hits < 3:
         return {}
 
-    field_row = [norm(x) for x in rows[best_i]]
-    value_row = [norm(x) for x in rows[best_i + 1]]
+    field_row = ["" if x is None else str(x).strip() for x in rows[best_i]]
+    value_row = ["" if x is None else str(x).strip() for x in rows[best_i + 1]]
 
     out: Dict[str, str] = {}
     for j, f in enumerate(field_row):
         canon = canonical_header_key(f)
         if not canon:
             continue
-        if j < len(value_row) and norm(value_row[j]) != "":
-            out[canon] = norm(value_row[j])
+        if j < len(value_row) and value_row[j] != "":
+            out[canon] = value_row[j]
 
     return out
 
+def read_header_combined(ws) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Reads the Header sheet once for both layouts, returning (key/value pairs,
+    row-values). Only the first 16 rows can matter to the row-values layout
+    (field row within 15, values right after); they are buffered for it, then
+    fed back ahead of the rest of the sheet for the key/value parse.
+    """
+    rows = ws.iter_rows(values_only=True)
+    head = list(islice(rows, 16))
+    return _header_key_value(chain(head, rows)), _header_row_values(head)
+
+SOPINFO_DEFAULTS: Dict[str, str] = {
+    "name": "",
+    "id": "",
+    "entity": "",
+    "repo": "/workspaces/SOP_Build",
+    "webRoot": "/SOP_Stage",
+    "runLabel": "",
+    "imgFolder": "../outputs/images/<SOP_ID>",
+    "templateTag": "v8 – injected"
+}
+
 def build_sopinfo(header_data: Dict[str, str]) -> Dict[str, Any]:
     """
     Build sopInfo object expected by v8 template.
     """
-    base = {
-        "name": "",
-        "id": "",
-        "entity": "",
-        "repo": "/workspaces/SOP_Build",
-        "webRoot": "/SOP_Stage",
-        "runLabel": "",
-        "imgFolder": "../outputs/images/<SOP_ID>",
-        "templateTag": "v8 – injected"
-    }
-
-    # header_data may be mixed (canonical keys OR original keys)
-    # normalize: allow either canonical keys or raw keys that match synonyms
-    normalized: Dict[str, str] = {}
+    base: Dict[str, Any] = dict(SOPINFO_DEFAULTS)
 
+    # header_data may be mixed (canonical keys OR original keys); values are
+    # already norm()'d by the header readers. Later keys win, and a blank
+    # value puts the default back, same as the old normalize-then-copy.
     for k, v in header_data.items():
-        ck = canonical_header_key(k)
+        ck = canonical_header_key(k) or (k if k in SOPINFO_DEFAULTS else None)
         if ck:
-            normalized[ck] = norm(v)
-        else:
-            # already canonical?
-            if k in base:
-                normalized[k] = norm(v)
-
-    for k in base:
-        if k in normalized and normalized[k] != "":
-            base[k] = normalized[k]
+            base[ck] = v or SOPINFO_DEFAULTS[ck]
 
     return base
 
@@ -209,12 +237,10 @@ STEP_COL_SYNONYMS = {
     "done": {"done", "status", "complete", "completed"},
 }
 
+_STEP_SYN_INDEX = {syn: canon for canon, syns in STEP_COL_SYNONYMS.items() for syn in syns}
+
 def canon_step_col(name: str) -> Optional[str]:
-    ln = low(name)
-    for canon, syns in STEP_COL_SYNONYMS.items():
-        if ln in syns:
-            return canon
-    return None
+    return _STEP_SYN_INDEX.get(low(name))
 
 def find_steps_header_row(rows: List[Tuple[Any, ...]]) -> Optional[int]:
     """
@@ -223,7 +249,10 @@ def find_steps_header_row(rows: List[Tuple[Any, ...]]) -> Optional[int]:
     best_i = None
     best_hits = 0
     for i in range(min(30, len(rows))):
-        r = [norm(x) for x in rows[i]]
+        row = rows[i]
+        if len(row) - row.count(None) <= best_hits:
+            continue  # too few filled cells to beat the best row so far
+        r = ["" if x is None else str(x).strip() for x in row]
         hits = 0
         for cell in r:
             if canon_step_col(cell):
@@ -236,15 +265,18 @@ def find_steps_header_row(rows: List[Tuple[Any, ...]]) -> Optional[int]:
     return best_i
 
 def read_steps(ws) -> List[Dict[str, Any]]:
-    rows = list(ws.iter_rows(values_only=True))
-    if not rows:
+    # Buffer just the rows the header scan looks at; data rows then stream
+    # from the same iterator instead of materializing the whole sheet.
+    it = ws.iter_rows(values_only=True)
+    head = list(islice(it, 30))
+    if not head:
         return []
 
-    hdr_i = find_steps_header_row(rows)
+    hdr_i = find_steps_header_row(head)
     if hdr_i is None:
         return []
 
-    header = [norm(x) for x in rows[hdr_i]]
+    header = [norm(x) for x in head[hdr_i]]
     col_map: Dict[str, int] = {}
     for j, h in enumerate(header):
         c = canon_step_col(h)
@@ -254,39 +286,51 @@ def read_steps(ws) -> List[Dict[str, Any]]:
     out: List[Dict[str, Any]] = []
     blank_streak = 0
 
-    for r in rows[hdr_i + 1:]:
-        if all(norm(x) == "" for x in r):
+    # (field, column index) resolved once, not per row; fields with no column
+    # stay "" from the blank template. Short rows get padded out to `need`
+    # once, so the per-field lookups need no bounds checks.
+    fields = [(name, col_map[name]) for name in STEP_COL_SYNONYMS if name in col_map]
+    blank_vals = dict.fromkeys(STEP_COL_SYNONYMS, "")
+    need = max(col_map.values()) + 1
+
+    # rows after the header: rest of the buffer, then straight off the sheet
+    for r in chain(islice(head, hdr_i + 1, None), it):
+        # Fast path: an all-empty row is all None (tuple.count runs in C).
+        # Otherwise normalize each cell exactly once (norm() inlined: this runs
+        # per cell); the whitespace-only blank check and the field values share it.
+        nr = None if r.count(None) == len(r) else ["" if x is None else str(x).strip() for x in r]
+        if not nr or not any(nr):
             blank_streak += 1
             if blank_streak >= 10:
                 break
             continue
         blank_streak = 0
 
-        def get(col: str) -> str:
-            if col not in col_map:
-                return ""
-            j = col_map[col]
-            return norm(r[j]) if j < len(r) else ""
+        if len(nr) < need:
+            nr.extend([""] * (need - len(nr)))
+        vals = blank_vals.copy()
+        for name, j in fields:
+            vals[name] = nr[j]
 
-        order_raw = get("order")
+        order_raw = vals["order"]
         try:
             order = int(order_raw) if order_raw != "" else len(out) + 1
         except Exception:
             order = len(out) + 1
 
         step = {
-            "id": get("id") or f"Step{order}",
+            "id": vals["id"] or f"Step{order}",
             "order": order,
-            "title": get("title") or f"Step {order}",
-            "command": get("command"),
-            "reminder": get("reminder"),
-            "notes": get("notes"),
-            "done": boolish(get("done"), default=False),
+            "title": vals["title"] or f"Step {order}",
+            "command": vals["command"],
+            "reminder": vals["reminder"],
+            "notes": vals["notes"],
+            "done": boolish(vals["done"], default=False),
             "runs": []
         }
         out.append(step)
 
-    out.sort(key=lambda x: int(x.get("order", 10**9)))
+    out.sort(key=itemgetter("order"))  # order is always an int by now
     return out
 
 
@@ -294,35 +338,148 @@ def read_steps(ws) -> List[Dict[str, Any]]:
 # Template injection
 # -----------------------------
 
-SOPINFO_RE = re.compile(r"(?P<prefix>\blet\s+sopInfo\s*=\s*)\{.*?\}\s*;", re.DOTALL)
-STEPS_RE   = re.compile(r"(?P<prefix>\blet\s+steps\s*=\s*)\[\s*.*?\s*\]\s*;", re.DOTALL)
+def _skip_ws(text: str, i: int) -> int:
+    while i < len(text) and text[i].isspace():
+        i += 1
+    return i
 
-def inject(template_html: str, sop_info: Dict[str, Any], steps: List[Dict[str, Any]]) -> str:
-    if not SOPINFO_RE.search(template_html):
+def _literal_end(text: str, start: int) -> int:
+    """
+    Index just past the JS object/array literal that opens at text[start].
+    Linear walk tracking {} / [] nesting; quoted strings ('', "", ``) and
+    comments are skipped so brackets inside them don't count. -1 if unclosed.
+    """
+    depth = 0
+    i, n = start, len(text)
+    while i < n:
+        ch = text[i]
+        if ch in "\"'`":
+            i += 1
+            while i < n and text[i] != ch:
+                i += 2 if text[i] == "\\" else 1
+        elif text.startswith("//", i):
+            i = text.find("\n", i)
+            if i == -1:
+                return -1
+        elif text.startswith("/*", i):
+            i = text.find("*/", i)
+            if i == -1:
+                return -1
+            i += 1
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return -1
+
+# `let sopInfo = ` / `let steps = ` up to where the literal starts; one
+# finditer pass finds both, and a bracket walk finds where each literal ends
+_BINDING_RE = re.compile(r"\blet\s+(sopInfo|steps)\s*=\s*")
+_BINDING_OPENERS = {"sopInfo": "{", "steps": "["}
+
+def split_bindings(template_html: str) -> Tuple[str, ...]:
+    """
+    Split the template around its sopInfo / steps literals, in one scan:
+    (text, "sopInfo" | "steps", text, "sopInfo" | "steps", text). Each binding's
+    literal and trailing `;` are cut out; the `let <name> = ` prefix stays.
+    Only the first binding of each name counts.
+    """
+    spans: Dict[str, Tuple[int, int]] = {}
+    taken_to = 0  # end of the last literal cut out; matches inside it are skipped
+    for m in _BINDING_RE.finditer(template_html):
+        name, lit = m.group(1), m.end()
+        if name in spans or m.start() < taken_to:
+            continue
+        if not template_html.startswith(_BINDING_OPENERS[name], lit):
+            continue
+        close = _literal_end(template_html, lit)
+        if close == -1:
+            continue
+        semi = _skip_ws(template_html, close)
+        if not template_html.startswith(";", semi):
+            continue
+        spans[name] = (lit, semi + 1)
+        taken_to = semi + 1
+        if len(spans) == len(_BINDING_OPENERS):
+            break
+
+    if "sopInfo" not in spans:
         raise RuntimeError("Template missing: let sopInfo = { ... };")
-    if not STEPS_RE.search(template_html):
+    if "steps" not in spans:
         raise RuntimeError("Template missing: let steps = [ ... ];")
 
-    sop_js = json_for_js(sop_info)
-    steps_js = json_for_js(steps)
-
-    template_html = SOPINFO_RE.sub(lambda m: f"{m.group('prefix')}{sop_js};", template_html, count=1)
-    template_html = STEPS_RE.sub(lambda m: f"{m.group('prefix')}{steps_js};", template_html, count=1)
-
-    return template_html
+    parts: List[str] = []
+    pos = 0
+    for name, (lit, end) in spans.items():  # found in document order
+        parts += [template_html[pos:lit], name]
+        pos = end
+    parts.append(template_html[pos:])
+    return tuple(parts)
 
+def write_injected(parts: Tuple[str, ...], values: Dict[str, Any], fh) -> None:
+    """
+    Write split template parts to a text file handle, dumping each binding's
+    JSON straight into it, so neither the JSON nor the finished page is ever
+    built as one big string.
+    """
+    for i, part in enumerate(parts):
+        if i % 2:
+            dump_for_js(values[part], fh)
+            fh.write(";")
+        else:
+            fh.write(part)
 
 # -----------------------------
-# Main
+# CLI
 # -----------------------------
 
-def main() -> int:
+_VALUE_FLAGS = {"--spec": "spec", "--template": "template", "--out-html": "out_html"}
+
+def _parse_args_fast(argv: List[str]) -> Optional[SimpleNamespace]:
+    """
+    The plain `--spec X --template Y --out-html Z [--debug]` form (any order),
+    without importing argparse. None for anything else.
+    """
+    args: Dict[str, Any] = {"debug": False}
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a == "--debug" and not args["debug"]:
+            args["debug"] = True
+            i += 1
+            continue
+        dest = _VALUE_FLAGS.get(a)
+        if dest is None or dest in args or i + 1 >= len(argv) or argv[i + 1].startswith("-"):
+            return None
+        args[dest] = argv[i + 1]
+        i += 2
+    return SimpleNamespace(**args) if len(args) == len(_VALUE_FLAGS) + 1 else None
+
+def parse_args(argv: List[str]) -> Any:
+    fast = _parse_args_fast(argv)
+    if fast is not None:
+        return fast
+
+    # --help, --opt=value, abbreviations, usage errors: leave those to argparse
+    import argparse
+
     ap = argparse.ArgumentParser()
     ap.add_argument("--spec", required=True)
     ap.add_argument("--template", required=True)
     ap.add_argument("--out-html", required=True)
     ap.add_argument("--debug", action="store_true")
-    args = ap.parse_args()
+    return ap.parse_args(argv)
+
+
+# -----------------------------
+# Main
+# -----------------------------
+
+def main() -> int:
+    args = parse_args(sys.argv[1:])
 
     spec_path = Path(args.spec)
     tpl_path = Path(args.template)
@@ -335,24 +492,31 @@ def main() -> int:
         print(f"ERROR: template not found: {tpl_path}", file=sys.stderr)
         return 2
 
-    wb = load_workbook(spec_path, data_only=True)
-
-    sh_header = find_sheet_name(wb, ["Header", "META", "Meta"])
-    sh_steps  = find_sheet_name(wb, ["Steps", "Checklist", "STEPS"])
-
-    if not sh_header:
-        print("ERROR: missing sheet 'Header' (or 'Meta').", file=sys.stderr)
-        return 2
-    if not sh_steps:
-        print("ERROR: missing sheet 'Steps' (or 'Checklist').", file=sys.stderr)
-        return 2
-
-    ws_h = wb[sh_header]
-    ws_s = wb[sh_steps]
-
-    # Try both header layouts and merge results (row-values wins if it finds keys)
-    kv = read_header_key_value(ws_h)
-    rv = read_header_row_values(ws_h)
+    # read_only: rows are streamed from the XML instead of building a cell grid;
+    # every reader below only uses iter_rows(values_only=True). (Not ws.values:
+    # in openpyxl that is just one more generator wrapped around the same call.)
+    wb = load_workbook(spec_path, data_only=True, read_only=True)
+    try:
+        sh_header = find_sheet_name(wb, ["Header", "META", "Meta"])
+        sh_steps  = find_sheet_name(wb, ["Steps", "Checklist", "STEPS"])
+
+        if not sh_header:
+            print("ERROR: missing sheet 'Header' (or 'Meta').", file=sys.stderr)
+            return 2
+        if not sh_steps:
+            print("ERROR: missing sheet 'Steps' (or 'Checklist').", file=sys.stderr)
+            return 2
+
+        ws_h = wb[sh_header]
+        ws_s = wb[sh_steps]
+
+        # Try both header layouts (one pass over the sheet); merged below
+        kv, rv = read_header_combined(ws_h)
+        steps = read_steps(ws_s)
+    finally:
+        # read-only workbooks hold the zip open until closed; release it before
+        # the template work, and on the early returns / errors above too
+        wb.close()
 
     # Merge: if rv has entries, prefer them
     header_data: Dict[str, str] = {}
@@ -360,13 +524,21 @@ def main() -> int:
     header_data.update(rv)       # canonical row-values
 
     sop_info = build_sopinfo(header_data)
-    steps = read_steps(ws_s)
 
     template_html = tpl_path.read_text(encoding="utf-8", errors="replace")
-    out_html = inject(template_html, sop_info, steps)
+    parts = split_bindings(template_html)  # raises before the output file is touched
 
+    # Write beside the target and swap it in, so a failed encode part-way
+    # never leaves a truncated page in place of the previous output
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(out_html, encoding="utf-8")
+    tmp_path = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as fh:
+            write_injected(parts, {"sopInfo": sop_info, "steps": steps}, fh)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
     if args.debug:
         # show what we actually got